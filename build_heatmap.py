@@ -1,68 +1,147 @@
-import folium, webbrowser, os, json
+import webbrowser, os, hashlib, functools, http.server, inspect, argparse, urllib.parse
+import orjson
+import jinja2
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import geopandas as gpd
-from shapely import wkt
-from shapely.geometry import mapping
+import shapely
 import numpy as np
 from branca.colormap import linear
 
 
+parser = argparse.ArgumentParser(description="Build the NYC yellow taxi tipping heatmap.")
+parser.add_argument(
+    "--serve", action="store_true",
+    help="after building, serve the map on localhost and open it in a browser (blocks until Ctrl+C)",
+)
+args = parser.parse_args()
+
+
 # Load per-year CSVs
 # -----------------------------------------------------------------------------
 YEARS = list(range(2015, 2023))
 paths = {y: f"./heatmaps/heat_{y}.csv" for y in YEARS}
 
-gdfs = {}
-for y in YEARS:
-    df = pd.read_csv(paths[y])
-    gdf = gpd.GeoDataFrame(df, geometry=df["wkt"].apply(wkt.loads), crs="EPSG:4326")
-    count_col = "num_trips" if "num_trips" in gdf.columns else "num_tips"
+# Geometry slimming: ~10 m simplification, ~1 m coordinate grid
+SIMPLIFY_TOL = 1e-4
+COORD_GRID = 1e-5
+
+# Preprocessed years are cached, keyed on the inputs and the pipeline itself
+CACHE_DIR = "./cache"
+
+# Columns used after load_year; the raw wkt and unused CSV fields are dropped
+# so they never reach the cache
+KEEP_COLUMNS = [
+    "zone_id", "zone_name", "borough", "geometry",
+    "avg_tip", "med_tip", "avg_rate", "num_trips",
+    "avg_tip_s", "med_tip_s", "avg_rate_s", "num_trips_s", "tooltip_html",
+]
+
+
+# Format only the non-null values, missing ones get a dash
+def format_col(series, fmt, as_int=False):
+    out = pd.Series("—", index=series.index, dtype=object)
+    mask = series.notna()
+    vals = series[mask]
+    if as_int:
+        vals = vals.astype("int64")
+    out[mask] = vals.map(fmt.format)
+    return out
+
+
+# Fixed CSV schema, parsed by the multithreaded pyarrow reader
+CSV_DTYPES = {
+    "zone_id": "int64[pyarrow]",
+    "borough": "string[pyarrow]",
+    "zone_name": "string[pyarrow]",
+    "wkt": "string[pyarrow]",
+    "avg_tip": "float64[pyarrow]",
+    "med_tip": "float64[pyarrow]",
+    "avg_rate": "float64[pyarrow]",
+    "num_trips": "int64[pyarrow]",
+    "num_tips": "int64[pyarrow]",
+}
 
-    gdf["year"] = y
+
+# Cache key from the input CSV mtimes, the load settings and the source of the
+# load functions, so editing any of them invalidates the cache
+def cache_path():
+    h = hashlib.sha1()
+    for p in paths.values():
+        h.update(f"{p}:{os.path.getmtime(p)}".encode())
+    h.update(repr((SIMPLIFY_TOL, COORD_GRID, sorted(CSV_DTYPES.items()), KEEP_COLUMNS)).encode())
+    for fn in (format_col, load_year):
+        h.update(inspect.getsource(fn).encode())
+    return os.path.join(CACHE_DIR, f"heat_{h.hexdigest()[:16]}.parquet")
+
+
+def load_year(y):
+    # Same row order every year so zones line up by position across years
+    df = pd.read_csv(paths[y], engine="pyarrow", dtype_backend="pyarrow", dtype=CSV_DTYPES)
+    df = df.sort_values(["zone_id", "wkt"], ignore_index=True)
+    # Some exports name the trip count num_tips
+    df = df.rename(columns={"num_tips": "num_trips"})
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkt(df["wkt"], crs="EPSG:4326"))
+    gdf["geometry"] = gdf.geometry.simplify(SIMPLIFY_TOL, preserve_topology=True).set_precision(COORD_GRID)
 
     # Preformat strings for tooltips
-    gdf["avg_tip_s"] = gdf["avg_tip"].map(
-        lambda v: f"${v:,.2f}" if pd.notnull(v) else "—"
-    )
-    gdf["med_tip_s"] = gdf["med_tip"].map(
-        lambda v: f"${v:,.2f}" if pd.notnull(v) else "—"
-    )
-    gdf["avg_rate_s"] = gdf["avg_rate"].map(
-        lambda v: f"{v:.1f}%" if pd.notnull(v) else "—"
-    )
-    gdf["num_trips_s"] = gdf[count_col].map(
-        lambda v: f"{int(v):,}" if pd.notnull(v) else "—"
-    )
+    gdf["avg_tip_s"] = format_col(gdf["avg_tip"], "${:,.2f}")
+    gdf["med_tip_s"] = format_col(gdf["med_tip"], "${:,.2f}")
+    gdf["avg_rate_s"] = format_col(gdf["avg_rate"], "{:.1f}%")
+    gdf["num_trips_s"] = format_col(gdf["num_trips"], "{:,}", as_int=True)
 
     # Build HTML for the info card tooltip
-    def build_tooltip(row):
-        return f"""
-        <div class="tipcard">
-          <div class="tipcard-header">
-            <div class="tipcard-title">{row['zone_name']}</div>
-            <div class="tipcard-tag">{row['borough']}</div>
-          </div>
-          <div class="tipcard-subtitle">Year: {row['year']}</div>
-          <div class="tipcard-metrics">
-            <div><strong>Avg tip:</strong> {row['avg_tip_s']}</div>
-            <div><strong>Median tip:</strong> {row['med_tip_s']}</div>
-            <div><strong>Tip rate:</strong> {row['avg_rate_s']}</div>
-            <div><strong>Trips:</strong> {row['num_trips_s']}</div>
-          </div>
-        </div>
-        """
-
-    gdf["tooltip_html"] = gdf.apply(build_tooltip, axis=1)
-    gdfs[y] = gdf
+    gdf["tooltip_html"] = (
+        '<div class="tipcard">'
+        '<div class="tipcard-header">'
+        '<div class="tipcard-title">' + gdf["zone_name"].astype(str) + '</div>'
+        '<div class="tipcard-tag">' + gdf["borough"].astype(str) + '</div>'
+        '</div>'
+        f'<div class="tipcard-subtitle">Year: {y}</div>'
+        '<div class="tipcard-metrics">'
+        '<div><strong>Avg tip:</strong> ' + gdf["avg_tip_s"] + '</div>'
+        '<div><strong>Median tip:</strong> ' + gdf["med_tip_s"] + '</div>'
+        '<div><strong>Tip rate:</strong> ' + gdf["avg_rate_s"] + '</div>'
+        '<div><strong>Trips:</strong> ' + gdf["num_trips_s"] + '</div>'
+        '</div>'
+        '</div>'
+    )
+    return gdf[KEEP_COLUMNS]
+
+
+cache_file = cache_path()
+if os.path.exists(cache_file):
+    cached = gpd.read_parquet(cache_file)
+    gdfs = {
+        y: cached[cached["year"] == y].drop(columns="year").reset_index(drop=True)
+        for y in YEARS
+    }
+else:
+    # Years are independent and the heavy lifting (CSV parse, WKT, GEOS) runs
+    # outside the GIL
+    with ThreadPoolExecutor(max_workers=len(YEARS)) as ex:
+        gdfs = dict(zip(YEARS, ex.map(load_year, YEARS)))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Year only exists as a column in the cache file, to split it back up.
+    # Written to a temp file first so an interrupted run leaves no partial cache
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    pd.concat([gdf.assign(year=y) for y, gdf in gdfs.items()], ignore_index=True).to_parquet(tmp_file)
+    os.replace(tmp_file, cache_file)
 
 
 # Global ranges per metric, each metric sits across all years
 # -----------------------------------------------------------------------------
-def robust_range(series, is_rate=False):
-    arr = pd.Series(series).dropna().to_numpy()
+def robust_range(arr, is_rate=False):
+    arr = arr[~np.isnan(arr)]
     if arr.size == 0:
         return (0.0, 1.0)
-    vmin, vmax = np.nanquantile(arr, [0.003, 0.997])
+    # Linearly interpolated quantiles like np.quantile, but from one partial
+    # partition instead of a full sort
+    pos = np.array([0.003, 0.997]) * (arr.size - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, arr.size - 1)
+    part = np.partition(arr, np.union1d(lo, hi))
+    vmin, vmax = part[lo] + (part[hi] - part[lo]) * (pos - lo)
     if is_rate:
         vmin = max(0.0, vmin)
         vmax = max(vmin + 1.0, vmax)
@@ -72,7 +151,7 @@ def robust_range(series, is_rate=False):
 metrics = ["avg_tip", "med_tip", "avg_rate"]
 ranges = {}
 for m in metrics:
-    all_vals = pd.concat([gdfs[y][m] for y in YEARS], ignore_index=True)
+    all_vals = np.concatenate([gdfs[y][m].to_numpy(dtype=float) for y in YEARS])
     ranges[m] = robust_range(all_vals, is_rate=(m == "avg_rate"))
 
 
@@ -85,8 +164,11 @@ def make_continuous_legend_html(caption, vmin, vmax, *, n_ticks=7, money_mode=Tr
     if palette is None:
         palette = linear.RdYlGn_11.scale(vmin, vmax)
 
-    grad_vals = np.linspace(vmin, vmax, 64)
-    grad_css = ", ".join(palette(v) for v in grad_vals)
+    # CSS interpolates between the palette stops itself, no need to sample
+    span = (palette.vmax - palette.vmin) or 1.0
+    grad_css = ", ".join(
+        f"{palette.rgb_hex_str(x)} {(x - palette.vmin) / span * 100:.1f}%" for x in palette.index
+    )
 
     raw_ticks = np.linspace(vmin, vmax, n_ticks)
     if money_mode:
@@ -133,11 +215,23 @@ legend_for_metric = {
 }
 
 
-# Color function (sync with legend)
-def color_for(metric, val):
-    if val is None or pd.isna(val):
-        return "#cccccc"
-    return PALETTES[metric](val)
+# Color lookup tables (sync with legend), sampled once per metric and shipped
+# to the page once; features only carry indices into them. The extra last
+# entry is the color for missing values.
+LUT_SIZE = 1024
+PALETTE_LUT = {
+    m: [PALETTES[m].rgb_hex_str(v) for v in np.linspace(*ranges[m], LUT_SIZE)] + ["#cccccc"]
+    for m in metrics
+}
+
+
+def color_idx(metric, series):
+    vals = series.to_numpy(dtype=float)
+    vmin, vmax = ranges[metric]
+    span = (vmax - vmin) or 1.0
+    idx = np.rint((np.clip(vals, vmin, vmax) - vmin) / span * (LUT_SIZE - 1))
+    idx[np.isnan(vals)] = LUT_SIZE
+    return idx.astype(np.uint16)
 
 
 # Default metric/year and precomputed colors
@@ -148,513 +242,104 @@ default_year = YEARS[0]
 for y in YEARS:
     gdf = gdfs[y]
     for mtr in metrics:
-        gdf[f"color_{mtr}"] = gdf[mtr].apply(lambda v: color_for(mtr, v))
-    gdf["cur_color"] = gdf[f"color_{default_metric}"]
+        gdf[f"idx_{mtr}"] = color_idx(mtr, gdf[mtr])
 
 
-# Build the map
+# Map data files
 # -----------------------------------------------------------------------------
-m = folium.Map(location=[40.7128, -74.0060], zoom_start=11, tiles=None)
-folium.TileLayer("cartodbpositron", control=False).add_to(m)
-
-YEAR_TO_VARNAME = {}
-
-# Create one feature group per year to not overload with polygons
+# Zone shapes are identical across years, so they are written once to their
+# own file and the per-year colors and tooltips to another; the page fetches
+# both so the browser can cache them apart from the HTML
+ZONES_FILE = "zones.geojson"
+DATA_FILE = "per_year_data.json"
+
+zones = gdfs[default_year]
+# Rows line up on the (zone_id, wkt) sort, so both ids and shapes must match
 for y in YEARS:
     gdf = gdfs[y]
-    fg = folium.FeatureGroup(name=f"year_{y}", show=(y == default_year))
-
-    def style_fn(feature):
-        props = feature["properties"]
-        fill = props.get("cur_color", "#cccccc")
-        if fill is None:
-            fill = "#cccccc"
-        return {
-            "fillOpacity": 0.7,
-            "weight": 0.2,
-            "color": "#666",
-            "fillColor": fill,
-        }
-
-    for _, row in gdf.iterrows():
-        feature = {
-            "type": "Feature",
-            "geometry": mapping(row["geometry"]),
-            "properties": {
-                "color_avg_tip": row["color_avg_tip"],
-                "color_med_tip": row["color_med_tip"],
-                "color_avg_rate": row["color_avg_rate"],
-                "cur_color": row["cur_color"],
-                "tooltip_html": row["tooltip_html"],
-            },
-        }
-
-        gj = folium.GeoJson(
-            data=feature,
-            style_function=style_fn,
-            show=True,
-        )
-        folium.Tooltip(row["tooltip_html"], sticky=False).add_to(gj)
-        gj.add_to(fg)
-
-    fg.add_to(m)
-    YEAR_TO_VARNAME[str(y)] = fg.get_name()
-
-# Initial legend for default metric
-m.get_root().html.add_child(folium.Element(legend_for_metric[default_metric]))
-
-# Radio panels (Metric and Years)
-# -----------------------------------------------------------------------------
-controls_html = """
-<div id="control-stack" style="
-  position: fixed; 
-  top: 58px;           
-  right: 12px; 
-  z-index: 9999;
-  display: flex;
-  flex-direction: column;
-  gap: 10px;           
-">
-  <!-- Metric panel -->
-  <div class="control-box">
-    <div class="control-title">Metric</div>
-    <label class="control-item"><input type="radio" name="metric_sel" value="avg_tip" checked> Average Tip ($)</label>
-    <label class="control-item"><input type="radio" name="metric_sel" value="med_tip"> Median Tip ($)</label>
-    <label class="control-item"><input type="radio" name="metric_sel" value="avg_rate"> Average Tip Rate (%)</label>
-  </div>
-
-  <!-- Years panel -->
-  <div class="control-box">
-    <div class="control-title">Years</div>
-    {year_radios}
-  </div>
-</div>
-
-<style>
-  .control-box{{
-    background: rgba(255,255,255,0.95);
-    padding: 10px 12px;
-    border: 1px solid #bbb;
-    border-radius: 6px;
-    box-shadow: 0 1px 4px rgba(0,0,0,0.25);
-    font-size: 14px;
-    min-width: 160px;
-  }}
-  .control-title{{
-    font-weight: 700;
-    font-size: 16px;
-    text-align: center;
-    margin-bottom: 6px;
-  }}
-  .control-item{{ display:block; margin: 2px 0; white-space: nowrap; }}
-
-  /* Tooltip info card styling */
-  .tipcard {{
-    background: rgba(255, 255, 255, 0.97);
-    border-radius: 6px;
-    padding: 8px 10px;
-    box-shadow: 0 1px 4px rgba(0,0,0,0.25);
-    min-width: 220px;
-    max-width: 280px;
-    font-family: 'Segoe UI', Arial, sans-serif;
-    font-size: 13px;
-    color: #222;
-  }}
-  .tipcard-header {{
-    display: flex;
-    align-items: center;
-    justify-content: space-between;
-    gap: 8px;
-    margin-bottom: 4px;
-  }}
-  .tipcard-title {{
-    font-weight: 700;
-    font-size: 14px;
-    flex: 1;
-  }}
-  .tipcard-tag {{
-    font-size: 11px;
-    padding: 2px 6px;
-    border-radius: 10px;
-    background: #f0f0f0;
-    border: 1px solid #ddd;
-    white-space: nowrap;
-  }}
-  .tipcard-subtitle {{
-    font-size: 11px;
-    color: #555;
-    margin-bottom: 4px;
-  }}
-  .tipcard-metrics div {{
-    margin: 1px 0;
-  }}
-</style>
-"""
-
-year_radios = "".join(
-    f'<label class="control-item"><input type="radio" name="year_sel" value="{y}" {"checked" if y == default_year else ""}> {y}</label>'
-    for y in YEARS
-)
-
-m.get_root().html.add_child(folium.Element(controls_html.format(year_radios=year_radios)))
-
-
-# Help button and overlay
-# -----------------------------------------------------------------------------
-help_html = """
-<div id="help-button" title="How to use this map">?</div>
-
-<div id="help-overlay" style="display:none;">
-  <div id="help-backdrop"></div>
-  <div id="help-box">
-    <div id="help-header">
-      <span id="help-title">How to read this map</span>
-      <button id="help-close" aria-label="Close help">&times;</button>
-    </div>
-    <div id="help-body">
-      <p><strong>What this map shows</strong><br>
-      This map displays how taxi tipping behavior varies across New York City taxi zones from 2015–2022.
-      You can explore three different tipping metrics and switch between years to see how patterns change over time.</p>
-
-      <p><strong>Colors</strong><br>
-      Green zones indicate relatively higher values for the selected metric.<br>
-      Yellow, orange, and red zones indicate relatively lower values.<br>
-      Gray zones represent areas with limited or missing data.</p>
-
-      <p><strong>Controls</strong><br>
-      <em>Metric:</em> choose whether you want to view average tip amount, median tip amount, or tip rate (tip as a percent of the fare).<br>
-      <em>Years:</em> select which calendar year’s data you want to display on the map.</p>
-
-      <p><strong>How to interact</strong><br>
-      • Hover over any zone to see its detailed statistics in the info card.<br>
-      • Use the metric selector to compare the same zone across different tipping measures.<br>
-      • Use the year selector to see how patterns shift across 2015–2022.<br>
-      • Pan and zoom like any other online map to focus on specific neighborhoods or boroughs.</p>
-    </div>
-    <div id="help-footer">
-      <button id="help-ok">Got it</button>
-    </div>
-  </div>
-</div>
-
-<style>
-  /* Help button in bottom-right corner */
-  #help-button {
-    position: fixed;
-    right: 18px;
-    bottom: 18px;
-    z-index: 9999;
-    width: 34px;
-    height: 34px;
-    border-radius: 50%;
-    background: #ffffff;
-    border: 1px solid #bbb;
-    box-shadow: 0 1px 4px rgba(0,0,0,0.25);
-    font-family: 'Segoe UI', Arial, sans-serif;
-    font-size: 20px;
-    font-weight: 700;
-    color: #333;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    cursor: pointer;
-  }
-  #help-button:hover {
-    background: #f5f5f5;
-  }
-
-  /* Overlay + box */
-  #help-overlay {
-    position: fixed;
-    inset: 0;
-    z-index: 9998;
-  }
-  #help-backdrop {
-    position: absolute;
-    inset: 0;
-    background: rgba(0,0,0,0.35);
-  }
-  #help-box {
-    position: absolute;
-    max-width: 520px;
-    width: 90%;
-    top: 50%;
-    left: 50%;
-    transform: translate(-50%, -50%);
-    background: #ffffff;
-    border-radius: 8px;
-    box-shadow: 0 4px 16px rgba(0,0,0,0.35);
-    font-family: 'Segoe UI', Arial, sans-serif;
-    color: #222;
-    padding: 12px 16px 10px 16px;
-  }
-  #help-header {
-    display: flex;
-    align-items: center;
-    justify-content: space-between;
-    margin-bottom: 6px;
-  }
-  #help-title {
-    font-size: 16px;
-    font-weight: 700;
-  }
-  #help-close {
-    border: none;
-    background: transparent;
-    font-size: 20px;
-    line-height: 1;
-    cursor: pointer;
-    padding: 0 4px;
-  }
-  #help-body {
-    font-size: 13px;
-    line-height: 1.4;
-    max-height: 260px;
-    overflow-y: auto;
-  }
-  #help-body p {
-    margin: 6px 0;
-  }
-  #help-footer {
-    display: flex;
-    justify-content: flex-end;
-    margin-top: 8px;
-  }
-  #help-ok {
-    border-radius: 4px;
-    border: 1px solid #0078d4;
-    background: #0078d4;
-    color: #ffffff;
-    font-size: 13px;
-    padding: 4px 10px;
-    cursor: pointer;
-  }
-  #help-ok:hover {
-    background: #0063b5;
-  }
-</style>
-"""
-
-m.get_root().html.add_child(folium.Element(help_html))
-
-
-# Main JS toggler; recolor by metrics, highlighting, etc
-# -----------------------------------------------------------------------------
-legend_js_map = json.dumps(legend_for_metric)
-vars_js_map = json.dumps(YEAR_TO_VARNAME)
-map_var_name = m.get_name()
-init_metric = default_metric
-init_year = str(default_year)
-
-js = """
-<script>
-const LEGEND_BY_METRIC = __LEGEND__;
-const YEAR_TO_VARNAME  = __VARS__;
-const MAP_VAR_NAME     = "__MAPVAR__";
-
-function removeLegend() {
-  const el = document.getElementById('tip-legend');
-  if (el) el.remove();
-}
-function addLegend(metric) {
-  removeLegend();
-  const wrap = document.createElement('div');
-  wrap.innerHTML = LEGEND_BY_METRIC[metric];
-  document.body.appendChild(wrap.firstElementChild);
-}
-
-function layerFromVar(varName) {
-  return window[varName] || null;
-}
-
-function hideAllYears(mapObj) {
-  for (const year in YEAR_TO_VARNAME) {
-    const vname = YEAR_TO_VARNAME[year];
-    const lyr   = layerFromVar(vname);
-    if (lyr && mapObj.hasLayer(lyr)) {
-      mapObj.removeLayer(lyr);
-    }
-  }
-}
-
-// Recolor a given year layer according to the chosen metric
-function recolorLayerByMetric(lyr, metric) {
-  const colorProp = "color_" + metric;
-
-  function applyToLayer(l) {
-    // If this layer has feature properties, recolor it
-    if (l.feature && l.feature.properties) {
-      const props = l.feature.properties;
-      const fill  = props[colorProp] || "#cccccc";
-
-      if (l.setStyle) {
-        l.setStyle({ fillColor: fill });
-      }
-      props.cur_color = fill;
+    if (
+        len(gdf) != len(zones)
+        or not np.array_equal(gdf["zone_id"].to_numpy(), zones["zone_id"].to_numpy())
+        or not gdf.geometry.geom_equals_exact(zones.geometry, tolerance=0, align=False).all()
+    ):
+        raise ValueError(f"Zones for {y} do not match {default_year}")
+
+ZONE_YEAR_DATA = {
+    str(y): {
+        **{f"idx_{mtr}": gdfs[y][f"idx_{mtr}"].tolist() for mtr in metrics},
+        "tooltip_html": gdfs[y]["tooltip_html"].tolist(),
     }
-
-    // If this layer has children, recurse into them
-    if (l.eachLayer) {
-      l.eachLayer(applyToLayer);
-    }
-  }
-
-  if (!lyr) return;
-  applyToLayer(lyr);
-}
-
-// Attach custom hover handlers 
-function attachHighlightHandlers(lyr) {
-  if (!lyr || !lyr.eachLayer) return;
-
-  lyr.eachLayer(function (featLayer) {
-    if (featLayer._highlightBound) return;
-
-    featLayer.on('mouseover', function(e) {
-      this.setStyle({
-        weight: 2,
-        color: "#000",
-        fillOpacity: 0.85
-      });
-    });
-
-    featLayer.on('mouseout', function(e) {
-      this.setStyle({
-        weight: 0.2,
-        color: "#666",
-        fillOpacity: 0.7
-      });
-    });
-
-    featLayer._highlightBound = true;
-  });
-}
-
-function showYearAndMetric(mapObj, metric, year) {
-  hideAllYears(mapObj);
-  const vname = YEAR_TO_VARNAME[year];
-  const lyr   = layerFromVar(vname);
-
-  if (lyr) {
-    mapObj.addLayer(lyr);
-    recolorLayerByMetric(lyr, metric);
-    attachHighlightHandlers(lyr);
-    addLegend(metric);
-  } else {
-    console.error("Layer not found for year", year, "->", vname);
-  }
-}
-
-function curMetric() {
-  const radios = document.querySelectorAll("input[name='metric_sel']");
-  for (const r of radios) {
-    if (r.checked) return r.value;
-  }
-  return "__INIT_METRIC__";
-}
-function curYear() {
-  const radios = document.querySelectorAll("input[name='year_sel']");
-  for (const r of radios) {
-    if (r.checked) return r.value;
-  }
-  return "__INIT_YEAR__";
+    for y in YEARS
 }
 
-function wireControls(mapObj) {
-  const metricRadios = document.querySelectorAll("input[name='metric_sel']");
-  const yearRadios   = document.querySelectorAll("input[name='year_sel']");
-
-  const handler = () => showYearAndMetric(mapObj, curMetric(), curYear());
-
-  metricRadios.forEach(r => r.addEventListener('change', handler));
-  yearRadios.forEach(r   => r.addEventListener('change', handler));
 
-  showYearAndMetric(mapObj, curMetric(), curYear());
-}
-
-window.addEventListener('load', () => {
-  const mapObj = window[MAP_VAR_NAME];
-  setTimeout(() => wireControls(mapObj), 0);
-});
-</script>
-"""
-
-js = (
-    js.replace("__LEGEND__", legend_js_map)
-      .replace("__VARS__", vars_js_map)
-      .replace("__MAPVAR__", map_var_name)
-      .replace("__INIT_METRIC__", init_metric)
-      .replace("__INIT_YEAR__", init_year)
+# GEOS writes every geometry's GeoJSON in one call, features are stitched
+# together as strings
+geom_json = shapely.to_geojson(zones.geometry.values)
+zones_geojson = (
+    '{"type":"FeatureCollection","features":['
+    + ",".join(
+        f'{{"type":"Feature","geometry":{g},"properties":{{"zone_idx":{i}}}}}'
+        for i, g in enumerate(geom_json)
+    )
+    + "]}"
 )
 
-m.get_root().html.add_child(folium.Element(js))
-
-
-# Help overlay wiring
-# -----------------------------------------------------------------------------
-help_js = """
-<script>
-window.addEventListener('load', function() {
-  const helpBtn    = document.getElementById('help-button');
-  const helpOverlay = document.getElementById('help-overlay');
-  const helpClose   = document.getElementById('help-close');
-  const helpOk      = document.getElementById('help-ok');
-  const helpBackdrop = document.getElementById('help-backdrop');
-
-  if (!helpBtn || !helpOverlay) return;
-
-  function openHelp() {
-    helpOverlay.style.display = 'block';
-  }
-  function closeHelp() {
-    helpOverlay.style.display = 'none';
-  }
-
-  helpBtn.addEventListener('click', openHelp);
-  helpClose.addEventListener('click', closeHelp);
-  helpOk.addEventListener('click', closeHelp);
-  helpBackdrop.addEventListener('click', closeHelp);
-
-  document.addEventListener('keydown', function(e) {
-    if (e.key === 'Escape') {
-      closeHelp();
-    }
-  });
-});
-</script>
-"""
-
-m.get_root().html.add_child(folium.Element(help_js))
-
-
-# Title
+# Render the page; the map, panels, help overlay and JS all live in one
+# template next to this script
 # -----------------------------------------------------------------------------
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_template.html")
 map_title = "New York City Yellow Taxi Tipping Trends (2015–2022)"
-title_html = f"""
-<div style="
-    position: fixed;
-    top: 10px;
-    left: 50%;
-    transform: translateX(-50%);
-    z-index: 9999;
-    background: rgba(255, 255, 255, 0.9);
-    padding: 8px 18px;
-    border-radius: 8px;
-    box-shadow: 0 2px 6px rgba(0,0,0,0.2);
-    font-size: 22px;
-    font-weight: 700;
-    font-family: 'Segoe UI', Arial, sans-serif;
-    color: #222;
-    letter-spacing: 0.5px;
-">
-    {map_title}
-</div>
-"""
-m.get_root().html.add_child(folium.Element(title_html))
+
+with open(TEMPLATE_PATH, encoding="utf-8") as f:
+    template = jinja2.Template(f.read(), trim_blocks=True, lstrip_blocks=True)
+
+page_html = template.render(
+    title=map_title,
+    years=YEARS,
+    init_metric=default_metric,
+    init_year=default_year,
+    legend_html=legend_for_metric[default_metric],
+    legend_by_metric=orjson.dumps(legend_for_metric).decode(),
+    palette_lut=orjson.dumps(PALETTE_LUT).decode(),
+    zones_url=ZONES_FILE,
+    data_url=DATA_FILE,
+)
 
 
 # Save and open
 # -----------------------------------------------------------------------------
 out = os.path.abspath("tips_map_slim.html")
-m.save(out)
-webbrowser.open(f"file://{out}")
+out_dir = os.path.dirname(out)
+with open(out, "w", encoding="utf-8") as f:
+    f.write(page_html)
+with open(os.path.join(out_dir, ZONES_FILE), "w", encoding="utf-8") as f:
+    f.write(zones_geojson)
+with open(os.path.join(out_dir, DATA_FILE), "wb") as f:
+    f.write(orjson.dumps(ZONE_YEAR_DATA))
+
+print(f"Wrote {out}, {ZONES_FILE} and {DATA_FILE}")
+
+if not args.serve:
+    print("Browsers block fetch() on file:// pages; rerun with --serve to view the map locally")
+else:
+    served_files = {os.path.basename(out), ZONES_FILE, DATA_FILE}
+
+    # Only the generated files are reachable, not the rest of the folder
+    class MapFilesHandler(http.server.SimpleHTTPRequestHandler):
+        def send_head(self):
+            name = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip("/")
+            if name not in served_files:
+                self.send_error(404)
+                return None
+            return super().send_head()
+
+    handler = functools.partial(MapFilesHandler, directory=out_dir)
+    with http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+        port = server.server_address[1]
+        webbrowser.open(f"http://127.0.0.1:{port}/{os.path.basename(out)}")
+        print(f"Serving the map at http://127.0.0.1:{port}/{os.path.basename(out)} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass